@@ -4,28 +4,48 @@ FastAPI backend for Prompt-to-JSON Enhancer
 Handles API requests and integrates with Grok AI
 """
 
-from fastapi import FastAPI, HTTPException
+from contextlib import asynccontextmanager
+from fastapi import Depends, FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
 import os
 from dotenv import load_dotenv
 import logging
+import orjson
+
+# Load environment variables before importing modules that read them at import time
+load_dotenv()
 
 from models import PromptRequest, EnhancedPromptResponse
 from services import PromptEnhancerService
 
-# Load environment variables
-load_dotenv()
-
 # Configure logging
-logging.basicConfig(level=logging.INFO)
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO").upper())
 logger = logging.getLogger(__name__)
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Create the enhancer service on startup and release it on shutdown"""
+    # Built per lifespan so its HTTP client, queues and background tasks belong
+    # to the event loop that is serving this worker
+    prompt_service = PromptEnhancerService()
+    prompt_service.start()
+    app.state.prompt_service = prompt_service
+    try:
+        yield
+    finally:
+        await prompt_service.aclose()
+
+def get_enhancer(request: Request) -> PromptEnhancerService:
+    """Return the enhancer service created by the app's lifespan"""
+    return request.app.state.prompt_service
+
 # Initialize FastAPI app
 app = FastAPI(
     title="Prompt-to-JSON Enhancer API",
     description="Transform simple prompts into structured JSON format for better AI interactions using Grok AI",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 
@@ -37,22 +57,27 @@ allowed_origins = [o.strip() for o in allowed_origins_env.split(",") if o.strip(
 # Configure CORS for frontend access
 app.add_middleware(
     CORSMiddleware,
-    allow_origins= allowed_origins,  # In production, specify your frontend domain
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+    allow_origins=allowed_origins,  # In production, specify your frontend domain
+    allow_credentials=False,  # The API uses no cookies or browser credentials
+    allow_methods=["GET", "POST"],
+    allow_headers=["Content-Type", "Authorization"],
+    max_age=86400,  # Let browsers cache preflight responses for a day
 )
 
-# Initialize services
-prompt_service = PromptEnhancerService()
-
 @app.get("/")
 async def root():
     """Health check endpoint"""
     return {"message": "Prompt-to-JSON Enhancer API is running with Grok AI!"}
 
-@app.post("/enhance-prompt", response_model=EnhancedPromptResponse)
-async def enhance_prompt(request: PromptRequest):
+@app.post(
+    "/enhance-prompt",
+    response_model=None,
+    responses={200: {"model": EnhancedPromptResponse}}
+)
+async def enhance_prompt(
+    request: PromptRequest,
+    prompt_service: PromptEnhancerService = Depends(get_enhancer)
+) -> Response:
     """
     Enhance a simple prompt into structured JSON format
     
@@ -63,39 +88,38 @@ async def enhance_prompt(request: PromptRequest):
         EnhancedPromptResponse with structured prompt data
     """
     try:
-        logger.info(f"Enhancing prompt: {request.original_prompt[:50]}...")
+        logger.info("Enhancing prompt: %.50s...", request.original_prompt)
         
-        # Validate input
-        if not request.original_prompt or len(request.original_prompt.strip()) < 3:
-            raise HTTPException(
-                status_code=400, 
-                detail="Prompt must be at least 3 characters long"
-            )
-        
-        # Enhance the prompt using Grok AI
-        enhanced_data = await prompt_service.enhance_prompt(
+        # Enhance the prompt; the service hands back the serialized response
+        # so FastAPI doesn't re-validate and re-encode it
+        enhanced_json = await prompt_service.enhance_prompt_json(
             original_prompt=request.original_prompt,
             enhancement_type=request.enhancement_type,
             target_audience=request.target_audience
         )
         
         logger.info("Prompt enhanced successfully")
-        return enhanced_data
+        return Response(content=enhanced_json, media_type="application/json")
         
     except ValueError as ve:
-        logger.error(f"Validation error: {str(ve)}")
+        logger.error("Validation error: %s", ve)
         raise HTTPException(status_code=400, detail=str(ve))
     
     except Exception as e:
-        logger.error(f"Error enhancing prompt: {str(e)}")
+        logger.error("Error enhancing prompt: %s", e)
         raise HTTPException(
             status_code=500, 
             detail="Internal server error. Please try again."
         )
 
+@app.get("/live")
+async def liveness():
+    """Liveness probe; does not contact the upstream API"""
+    return {"status": "ok"}
+
 @app.get("/health")
-async def health_check():
-    """Detailed health check for monitoring"""
+async def health_check(prompt_service: PromptEnhancerService = Depends(get_enhancer)):
+    """Detailed health check for monitoring (upstream probe is cached briefly)"""
     try:
         # Test Grok API connection
         api_status = await prompt_service.test_connection()
@@ -106,7 +130,7 @@ async def health_check():
             "version": "1.0.0"
         }
     except Exception as e:
-        logger.error(f"Health check failed: {str(e)}")
+        logger.error("Health check failed: %s", e)
         return JSONResponse(
             status_code=503,
             content={
@@ -115,28 +139,48 @@ async def health_check():
             }
         )
 
+# Template options never change at runtime, so serialize them once
+_TEMPLATES_BYTES = orjson.dumps({
+    "enhancement_types": [
+        {"id": "general", "name": "General Enhancement", "description": "Balanced enhancement for any prompt type"},
+        {"id": "creative", "name": "Creative Writing", "description": "Optimized for creative and artistic prompts"},
+        {"id": "technical", "name": "Technical/Coding", "description": "Best for programming and technical prompts"},
+        {"id": "business", "name": "Business/Marketing", "description": "Tailored for business and marketing prompts"},
+        {"id": "educational", "name": "Educational", "description": "Perfect for learning and teaching prompts"}
+    ],
+    "target_audiences": [
+        {"id": "general", "name": "General Audience"},
+        {"id": "beginner", "name": "Beginner"},
+        {"id": "intermediate", "name": "Intermediate"},
+        {"id": "expert", "name": "Expert/Professional"},
+        {"id": "student", "name": "Student"},
+        {"id": "business", "name": "Business Professional"}
+    ]
+})
+
 @app.get("/templates")
 async def get_templates():
     """Get available prompt enhancement templates"""
-    return {
-        "enhancement_types": [
-            {"id": "general", "name": "General Enhancement", "description": "Balanced enhancement for any prompt type"},
-            {"id": "creative", "name": "Creative Writing", "description": "Optimized for creative and artistic prompts"},
-            {"id": "technical", "name": "Technical/Coding", "description": "Best for programming and technical prompts"},
-            {"id": "business", "name": "Business/Marketing", "description": "Tailored for business and marketing prompts"},
-            {"id": "educational", "name": "Educational", "description": "Perfect for learning and teaching prompts"}
-        ],
-        "target_audiences": [
-            {"id": "general", "name": "General Audience"},
-            {"id": "beginner", "name": "Beginner"},
-            {"id": "intermediate", "name": "Intermediate"},
-            {"id": "expert", "name": "Expert/Professional"},
-            {"id": "student", "name": "Student"},
-            {"id": "business", "name": "Business Professional"}
-        ]
-    }
+    return Response(
+        content=_TEMPLATES_BYTES,
+        media_type="application/json",
+        headers={"Cache-Control": "public, max-age=3600"}
+    )
 
 if __name__ == "__main__":
     import uvicorn
     port = int(os.getenv("PORT", 8000))
-    uvicorn.run("main:app", host="0.0.0.0", port=port, reload=True)
\ No newline at end of file
+    
+    if os.getenv("ENVIRONMENT") == "production":
+        # One worker per CPU on uvloop + httptools
+        uvicorn.run(
+            "main:app",
+            host="0.0.0.0",
+            port=port,
+            workers=int(os.getenv("WEB_CONCURRENCY", os.cpu_count() or 1)),
+            loop="uvloop",
+            http="httptools"
+        )
+    else:
+        # Development: single worker with auto-reload
+        uvicorn.run("main:app", host="0.0.0.0", port=port, reload=True)
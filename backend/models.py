@@ -4,13 +4,22 @@ Pydantic models for request/response validation
 Defines the structure of API inputs and outputs
 """
 
-from pydantic import BaseModel, Field, validator
-from typing import Optional, List, Dict, Any
-from datetime import datetime
+from pydantic import BaseModel, ConfigDict, Field
+from typing import Optional, List, Dict, Any, Literal
+from datetime import datetime, timezone
+
+EnhancementType = Literal["general", "creative", "technical", "business", "educational"]
+AudienceType = Literal["general", "beginner", "intermediate", "expert", "student", "business"]
+
+def _now() -> datetime:
+    """Current time in UTC; skips the local timezone lookup and serializes with an offset"""
+    return datetime.now(timezone.utc)
 
 class PromptRequest(BaseModel):
     """Request model for prompt enhancement"""
     
+    model_config = ConfigDict(str_strip_whitespace=True, frozen=True)
+    
     original_prompt: str = Field(
         ..., 
         min_length=3,
@@ -18,34 +27,20 @@ class PromptRequest(BaseModel):
         description="The original prompt to be enhanced"
     )
     
-    enhancement_type: Optional[str] = Field(
+    enhancement_type: EnhancementType = Field(
         default="general",
         description="Type of enhancement: general, creative, technical, business, educational"
     )
     
-    target_audience: Optional[str] = Field(
+    target_audience: AudienceType = Field(
         default="general",
         description="Target audience: general, beginner, intermediate, expert, student, business"
     )
     
-    include_examples: Optional[bool] = Field(
+    include_examples: bool = Field(
         default=True,
         description="Whether to include example outputs in the enhanced prompt"
     )
-    
-    @validator('enhancement_type')
-    def validate_enhancement_type(cls, v):
-        valid_types = ['general', 'creative', 'technical', 'business', 'educational']
-        if v not in valid_types:
-            raise ValueError(f'enhancement_type must be one of: {valid_types}')
-        return v
-    
-    @validator('target_audience')
-    def validate_target_audience(cls, v):
-        valid_audiences = ['general', 'beginner', 'intermediate', 'expert', 'student', 'business']
-        if v not in valid_audiences:
-            raise ValueError(f'target_audience must be one of: {valid_audiences}')
-        return v
 
 class PromptStructure(BaseModel):
     """Structured representation of an enhanced prompt"""
@@ -136,7 +131,7 @@ class EnhancedPromptResponse(BaseModel):
     )
     
     created_at: datetime = Field(
-        default_factory=datetime.now,
+        default_factory=_now,
         description="Timestamp when the enhancement was created"
     )
     
@@ -164,7 +159,7 @@ class ErrorResponse(BaseModel):
     )
     
     timestamp: datetime = Field(
-        default_factory=datetime.now,
+        default_factory=_now,
         description="When the error occurred"
     )
 
@@ -187,6 +182,6 @@ class HealthResponse(BaseModel):
     )
     
     timestamp: datetime = Field(
-        default_factory=datetime.now,
+        default_factory=_now,
         description="Health check timestamp"
     )
\ No newline at end of file
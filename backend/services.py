@@ -5,21 +5,430 @@ Handles interaction with Hugging Face API
 """
 
 import os
-import json
+import re
+import time
+import socket
+import random
 import asyncio
+import hashlib
 import httpx
-from typing import Dict, Any, Optional
+import orjson
+from types import MappingProxyType
+from cachetools import TTLCache
+from tenacity import retry, retry_if_exception_type, stop_after_attempt, wait_exponential, wait_random
+from typing import Dict, Any, Optional, List, Union, Callable, Awaitable, Set, Tuple, Deque, get_args
+from collections import deque
+from contextlib import asynccontextmanager
 import logging
 
-from models import EnhancedPromptResponse, PromptStructure
+from models import EnhancedPromptResponse, PromptStructure, EnhancementType, AudienceType
 
 logger = logging.getLogger(__name__)
 
+class HuggingFaceTransientError(Exception):
+    """Retryable upstream failure (rate limited or server error)"""
+
+class HuggingFaceFatalError(Exception):
+    """Non-retryable upstream failure (client error)"""
+
+# Read once at import; main.py loads .env before importing this module
+_API_KEY = os.getenv("HUGGINGFACE_API_KEY") or None
+
+# Default headers for every Hugging Face request, baked into the shared client
+_BASE_HEADERS = MappingProxyType({
+    "Content-Type": "application/json",
+    **({"Authorization": f"Bearer {_API_KEY}"} if _API_KEY else {})
+})
+
+_ENHANCEMENT_INSTRUCTIONS = MappingProxyType({
+    "creative": "Focus on storytelling, creativity, and artistic elements.",
+    "technical": "Focus on technical precision, code requirements, and implementation details.",
+    "business": "Focus on business objectives, ROI, and professional outcomes.",
+    "educational": "Focus on learning objectives and pedagogical clarity.",
+    "general": "Provide balanced enhancement suitable for any domain."
+})
+
+_AUDIENCE_INSTRUCTIONS = MappingProxyType({
+    "beginner": "Use simple language and provide more context.",
+    "expert": "Use technical terminology and assume deep knowledge.",
+    "business": "Focus on business value and professional outcomes.",
+    "student": "Emphasize learning and educational value.",
+    "general": "Maintain accessibility for a general audience."
+})
+
+_TONES = MappingProxyType({
+    "creative": "Inspiring, imaginative, and engaging",
+    "technical": "Precise, professional, and detailed",
+    "business": "Professional, results-oriented, and strategic",
+    "educational": "Clear, supportive, and informative",
+    "general": "Balanced, professional, and accessible"
+})
+
+# The enhancement prompt only varies by the original prompt once the type and
+# audience are fixed, so everything around it is built once at import
+_PROMPT_HEAD = 'Transform this basic prompt into a highly effective, detailed prompt:\n\nOriginal: "'
+
+def _build_prompt_tail(enhancement_type: str, target_audience: str) -> str:
+    """Build the part of the enhancement prompt after the original prompt"""
+    enhancement_instruction = _ENHANCEMENT_INSTRUCTIONS.get(enhancement_type, _ENHANCEMENT_INSTRUCTIONS["general"])
+    audience_instruction = _AUDIENCE_INSTRUCTIONS.get(target_audience, _AUDIENCE_INSTRUCTIONS["general"])
+    return (
+        f'"\n\nEnhancement type: {enhancement_instruction}'
+        f'\nTarget audience: {audience_instruction}'
+        '\n\nEnhanced prompt:'
+    )
+
+# Keyed by every value a request can carry, including ones that fall back to
+# the general instructions, so the hot path is a single lookup
+_PROMPT_TAILS = MappingProxyType({
+    (enhancement_type, target_audience): _build_prompt_tail(enhancement_type, target_audience)
+    for enhancement_type in get_args(EnhancementType)
+    for target_audience in get_args(AudienceType)
+})
+
+# Fixed parts of every structured response, copied into lists per response
+_STATIC_REQUIREMENTS = (
+    "Provide clear, specific guidance",
+    "Use appropriate language for target audience",
+    "Include structured format",
+    "Maintain original intent while adding clarity"
+)
+
+_STATIC_CONSTRAINTS = (
+    "Stay true to original request",
+    "Avoid unnecessary complexity",
+    "Ensure actionable output"
+)
+
+_IMPROVEMENT_SUMMARY = (
+    "Added clear structure and context",
+    "Specified requirements and format",
+    "Tailored language for target audience",
+    "Enhanced clarity and specificity"
+)
+
+_USAGE_TIPS = (
+    "Use this enhanced prompt as-is for better AI responses",
+    "Adjust requirements based on your specific needs",
+    "Consider the target audience when using the output"
+)
+
+_CONTEXTS = MappingProxyType({
+    (enhancement_type, target_audience):
+        f"Enhanced prompt for {enhancement_type} use case targeting {target_audience} audience"
+    for enhancement_type in get_args(EnhancementType)
+    for target_audience in get_args(AudienceType)
+})
+
+# Rule-based enhancement used when every model fails; %s is the original prompt
+_FALLBACK_TEMPLATE = """**Context**: You are working on a task that requires clear, structured communication.
+
+**Objective**: %s
+
+**Requirements**:
+- Provide detailed, specific output
+- Use clear, professional language  
+- Include relevant examples where helpful
+- Structure your response logically
+
+**Output Format**: Please provide a comprehensive response that addresses all aspects of the request.
+
+**Additional Instructions**: Take your time to think through the request and provide the most helpful response possible."""
+
+_WORD_RE = re.compile(r"\S+")
+
+def _word_count(text: str) -> int:
+    """Count whitespace-separated words without building a list of them"""
+    return sum(1 for _ in _WORD_RE.finditer(text))
+
+def _extract_text(result: Any) -> Optional[str]:
+    """Pull the generated text out of a text-generation result, or None if it has none"""
+    if isinstance(result, list):
+        if not result:
+            return None
+        result = result[0]
+    if isinstance(result, dict):
+        text = result.get("generated_text")
+        if isinstance(text, str):
+            return text
+    return None
+
+def _extract_texts(result: Any, count: int) -> Optional[List[Optional[str]]]:
+    """Pull one generated text per input out of a batched result, or None if it has the wrong shape"""
+    if not isinstance(result, list) or len(result) != count:
+        return None
+    texts = [_extract_text(item) for item in result]
+    if all(text is None for text in texts):
+        return None
+    return texts
+
+# Models raced for each generation request
+_MODEL_URL = "https://api-inference.huggingface.co/models/"
+_MODELS = (
+    "microsoft/DialoGPT-medium",
+    "facebook/blenderbot-400M-distill",
+    "google/flan-t5-base"
+)
+
+# Tries per model while it answers 503 (model loading)
+_LOADING_ATTEMPTS = 3
+
+# Static tail of every generation request body
+_BODY_SUFFIX = b',"parameters":' + orjson.dumps({
+    "max_new_tokens": 500,
+    "temperature": 0.7,
+    "do_sample": True
+}) + b'}'
+
+# Body of the background pings that keep models loaded
+_WARMUP_BODY = orjson.dumps({"inputs": "ping"})
+
+# Upper bound on a generation response body; a batch of 500-token
+# generations is a few tens of KB
+_MAX_RESPONSE_BYTES = 1 << 20
+
+# Body of the connection probe sent by health checks
+_PROBE_BODY = orjson.dumps({"inputs": "Test connection"})
+
+class PromptBatcher:
+    """Collects prompts arriving within a short window into a single upstream call"""
+    
+    def __init__(
+        self,
+        handler: Callable[[List[str]], Awaitable[List[Optional[str]]]],
+        max_batch_size: int = 8,
+        max_wait: float = 0.025
+    ):
+        self._handler = handler
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._queue: Optional["asyncio.Queue[Tuple[str, asyncio.Future]]"] = None
+        self._task: Optional[asyncio.Task] = None
+        self._dispatches: Set[asyncio.Task] = set()
+    
+    def start(self) -> None:
+        """Start the collector task on the running event loop"""
+        if self._task is None:
+            # Created here rather than in __init__ so the queue belongs to this loop
+            self._queue = asyncio.Queue()
+            self._task = asyncio.create_task(self._run())
+            self._task.add_done_callback(self._on_run_done)
+    
+    async def stop(self) -> None:
+        """Stop collecting, flush queued prompts and wait for in-flight batches to finish"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            except Exception:
+                # Already logged by _on_run_done
+                pass
+            self._task = None
+        self._flush_queue()
+        if self._dispatches:
+            await asyncio.gather(*self._dispatches, return_exceptions=True)
+    
+    async def submit(self, prompt: str) -> Optional[str]:
+        """Queue a prompt and wait for its generated text (None if no model answered)"""
+        if self._task is None or self._task.done():
+            # Not started (e.g. used outside the app) or stopped; call straight through
+            return (await self._handler([prompt]))[0]
+        
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((prompt, future))
+        return await future
+    
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            try:
+                deadline = loop.time() + self.max_wait
+                
+                while len(batch) < self.max_batch_size:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                    except asyncio.TimeoutError:
+                        break
+            finally:
+                # Dispatch without blocking collection of the next batch; a
+                # partial batch is still sent if the collector is cancelled
+                self._spawn_dispatch(batch)
+    
+    def _on_run_done(self, task: asyncio.Task) -> None:
+        if not task.cancelled() and task.exception() is not None:
+            logger.error("Prompt batcher stopped unexpectedly: %s", task.exception())
+            # Nobody reads the queue any more; don't leave its callers waiting
+            self._flush_queue()
+    
+    def _flush_queue(self) -> None:
+        """Dispatch whatever is still queued, in batches of at most max_batch_size"""
+        if self._queue is None:
+            return
+        batch: List[Tuple[str, asyncio.Future]] = []
+        while not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+            if len(batch) == self.max_batch_size:
+                self._spawn_dispatch(batch)
+                batch = []
+        if batch:
+            self._spawn_dispatch(batch)
+    
+    def _spawn_dispatch(self, batch: List[Tuple[str, asyncio.Future]]) -> None:
+        task = asyncio.create_task(self._dispatch(batch))
+        self._dispatches.add(task)
+        task.add_done_callback(self._dispatches.discard)
+    
+    async def _dispatch(self, batch: List[Tuple[str, asyncio.Future]]) -> None:
+        try:
+            results = await self._handler([prompt for prompt, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+class AdaptiveLimiter:
+    """
+    Client-side throttle for upstream calls
+    
+    Concurrency follows AIMD: it grows by one after a full window of
+    successful calls and halves on a 429 or server error, at most once per
+    congestion event: failures from calls that started before the last
+    decrease were already accounted for by it. Calls also wait
+    out any Retry-After pause, and an optional sliding window caps the
+    number of requests started per minute.
+    """
+    
+    def __init__(
+        self,
+        initial: int = 8,
+        minimum: int = 1,
+        maximum: int = 64,
+        requests_per_minute: Optional[int] = None
+    ):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.limit = max(minimum, min(initial, maximum))
+        self.requests_per_minute = requests_per_minute
+        self._active = 0
+        self._successes = 0
+        self._paused_until = 0.0
+        self._last_decrease = 0.0
+        self._started: Deque[float] = deque()
+        self._condition = asyncio.Condition()
+    
+    @asynccontextmanager
+    async def slot(self):
+        """Hold one concurrency slot for the duration of an upstream call; yields its start time"""
+        async with self._condition:
+            await self._condition.wait_for(lambda: self._active < self.limit)
+            self._active += 1
+        try:
+            await self._wait_for_budget()
+            yield time.monotonic()
+        finally:
+            async with self._condition:
+                self._active -= 1
+                self._condition.notify_all()
+    
+    def record(self, status_code: int, headers: httpx.Headers, started: float) -> None:
+        """Adjust concurrency and pauses from the response to a call started at started"""
+        retry_after = _parse_retry_after(headers.get("retry-after"))
+        
+        if status_code == 429 or (status_code >= 500 and status_code != 503):
+            # Multiplicative decrease; 503 only means the model is loading. Calls
+            # racing the same overload all report it, but only one halving counts
+            if started >= self._last_decrease:
+                self.limit = max(self.minimum, self.limit // 2)
+                self._last_decrease = time.monotonic()
+            self._successes = 0
+            self._pause(retry_after)
+            return
+        
+        if status_code != 200:
+            return
+        
+        remaining = _parse_int(headers.get("x-ratelimit-remaining-requests"))
+        quota = _parse_int(headers.get("x-ratelimit-limit-requests"))
+        if remaining is not None and quota and remaining < quota * 0.1:
+            # Nearly out of quota: stop growing and honour any advertised pause
+            self._successes = 0
+            self._pause(retry_after)
+            return
+        
+        # Additive increase once a full window of calls has succeeded
+        self._successes += 1
+        # (waiters pick up the new limit when this call releases its slot)
+        if self._successes >= self.limit and self.limit < self.maximum:
+            self.limit += 1
+            self._successes = 0
+    
+    def _pause(self, delay: Optional[float]) -> None:
+        if delay:
+            self._paused_until = max(self._paused_until, time.monotonic() + delay)
+    
+    async def _wait_for_budget(self) -> None:
+        while True:
+            now = time.monotonic()
+            if now < self._paused_until:
+                await asyncio.sleep(self._paused_until - now)
+                continue
+            
+            if self.requests_per_minute is None:
+                return
+            
+            while self._started and now - self._started[0] >= 60:
+                self._started.popleft()
+            if len(self._started) < self.requests_per_minute:
+                self._started.append(now)
+                return
+            await asyncio.sleep(60 - (now - self._started[0]))
+
+def _parse_int(value: Optional[str]) -> Optional[int]:
+    try:
+        return int(value) if value is not None else None
+    except ValueError:
+        return None
+
+def _parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Read a Retry-After header given in seconds (HTTP dates are ignored)"""
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
 class PromptEnhancerService:
     """Service for enhancing prompts using Hugging Face API"""
     
-    def __init__(self):
-        self.api_key = os.getenv("HUGGINGFACE_API_KEY")
+    # Fixed attribute layout: slot access skips the instance __dict__ lookup
+    __slots__ = (
+        "api_key",
+        "api_url",
+        "_pool_size",
+        "_client",
+        "_limiter",
+        "_health_ttl",
+        "_health_checked_at",
+        "_health_ok",
+        "_cache",
+        "_inflight",
+        "_batcher",
+        "_warmup_interval",
+        "_warmup_task",
+    )
+    
+    def __init__(self, pool_size: Optional[int] = None):
+        self.api_key = _API_KEY
         self.api_url = "https://api-inference.huggingface.co/models/microsoft/DialoGPT-medium"
         # Alternative models you can try:
         # "microsoft/DialoGPT-large"
@@ -29,25 +438,136 @@ class PromptEnhancerService:
         if not self.api_key:
             # Hugging Face API works without key but with rate limits
             logger.warning("HUGGINGFACE_API_KEY not found. Using rate-limited public access.")
-            self.api_key = None
+        
+        # Shared client so connections are pooled and kept alive across requests;
+        # created lazily so it binds to the event loop that first uses it
+        self._pool_size = pool_size or int(os.getenv("HF_POOL_SIZE", 100))
+        self._client: Optional[httpx.AsyncClient] = None
+        
+        # Adaptive bound on concurrent upstream calls so bursts don't cascade into
+        # rate limiting; HF_RPM optionally caps requests per minute as well
+        self._limiter = AdaptiveLimiter(
+            initial=int(os.getenv("HF_CONCURRENCY_INITIAL", 8)),
+            maximum=int(os.getenv("HF_CONCURRENCY", 64)),
+            requests_per_minute=int(os.getenv("HF_RPM", 0)) or None
+        )
+        
+        # Last upstream probe result, reused by health checks for a short while
+        self._health_ttl = float(os.getenv("HEALTH_CACHE_TTL", 30))
+        self._health_checked_at = 0.0
+        self._health_ok = False
+        
+        # Exact-match cache of serialized responses keyed by prompt + enhancement
+        # options; TTLCache evicts least recently used entries once full
+        self._cache = TTLCache(
+            maxsize=int(os.getenv("CACHE_MAXSIZE", 10_000)),
+            ttl=int(os.getenv("CACHE_TTL", 3600))
+        )
+        # In-flight enhancements by cache key, for coalescing duplicate requests
+        self._inflight: Dict[str, asyncio.Task] = {}
+        
+        # Periodic pings keep the serverless models loaded; 0 disables them
+        self._warmup_interval = float(os.getenv("HF_WARMUP_INTERVAL", 300))
+        self._warmup_task: Optional[asyncio.Task] = None
+        
+        self._batcher = PromptBatcher(
+            self._call_huggingface_api_batch,
+            max_batch_size=int(os.getenv("BATCH_MAX_SIZE", 8)),
+            max_wait=float(os.getenv("BATCH_MAX_WAIT", 0.025))
+        )
+    
+    def start(self) -> None:
+        """Start background tasks; call from within the running event loop"""
+        self._batcher.start()
+        if self._warmup_interval > 0 and self._warmup_task is None:
+            self._warmup_task = asyncio.create_task(self._warmup_loop())
+    
+    async def aclose(self) -> None:
+        """Stop background tasks and close pooled connections"""
+        if self._warmup_task is not None:
+            self._warmup_task.cancel()
+            try:
+                await self._warmup_task
+            except asyncio.CancelledError:
+                pass
+            self._warmup_task = None
+        await self._batcher.stop()
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+    
+    def _get_client(self) -> httpx.AsyncClient:
+        """Return the shared HTTP client, creating it on first use"""
+        if self._client is None:
+            transport = httpx.AsyncHTTPTransport(
+                http2=True,
+                limits=httpx.Limits(
+                    max_connections=self._pool_size,
+                    max_keepalive_connections=max(1, self._pool_size // 2),
+                    # Keep idle sockets warm between bursts instead of the 5 s default
+                    keepalive_expiry=30.0
+                ),
+                retries=0,
+                # Pin Nagle off so small request bodies are never held back
+                socket_options=[(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)]
+            )
+            self._client = httpx.AsyncClient(
+                transport=transport,
+                # Generation can take a while to read, but a connect or pool wait
+                # that long means the upstream or our own pool is saturated
+                timeout=httpx.Timeout(connect=5.0, read=30.0, write=10.0, pool=5.0),
+                headers=_BASE_HEADERS
+            )
+        return self._client
+    
+    async def _warmup_models(self) -> None:
+        """Ping every fallback model in parallel so they are loaded before users need them"""
+        results = await asyncio.gather(
+            *(self._warmup_model(_MODEL_URL + model) for model in _MODELS),
+            return_exceptions=True
+        )
+        for model, result in zip(_MODELS, results):
+            if isinstance(result, Exception):
+                logger.warning("Warmup of %s failed: %s", model, result)
+            else:
+                logger.debug("Warmup of %s returned %s", model, result.status_code)
+    
+    async def _warmup_model(self, url: str) -> httpx.Response:
+        """Ping one model through the limiter, so warmup honours the same rate limits as user traffic"""
+        async with self._limiter.slot() as started:
+            response = await self._get_client().post(url, content=_WARMUP_BODY)
+            self._limiter.record(response.status_code, response.headers, started)
+            return response
+    
+    async def _warmup_loop(self) -> None:
+        """Warm the models at startup and again every warmup interval"""
+        while True:
+            await self._warmup_models()
+            await asyncio.sleep(self._warmup_interval)
     
     async def test_connection(self) -> bool:
-        """Test connection to Hugging Face API"""
+        """Test connection to Hugging Face API, reusing a recent result"""
+        now = time.monotonic()
+        if self._health_checked_at and now - self._health_checked_at < self._health_ttl:
+            return self._health_ok
+        
         try:
-            headers = {"Content-Type": "application/json"}
-            if self.api_key:
-                headers["Authorization"] = f"Bearer {self.api_key}"
-                
-            async with httpx.AsyncClient(timeout=10.0) as client:
-                response = await client.post(
+            # Through the limiter like any other upstream call, so probes respect
+            # Retry-After pauses and HF_RPM and feed their status back
+            async with self._limiter.slot() as started:
+                response = await self._get_client().post(
                     self.api_url,
-                    headers=headers,
-                    json={"inputs": "Test connection"}
+                    content=_PROBE_BODY,
+                    timeout=10.0
                 )
-                return response.status_code in [200, 503]  # 503 means model is loading
+                self._limiter.record(response.status_code, response.headers, started)
+            self._health_ok = response.status_code in [200, 503]  # 503 means model is loading
         except Exception as e:
-            logger.error(f"API connection test failed: {str(e)}")
-            return False
+            logger.error("API connection test failed: %s", e)
+            self._health_ok = False
+        
+        self._health_checked_at = now
+        return self._health_ok
     
     async def enhance_prompt(
         self, 
@@ -67,25 +587,107 @@ class PromptEnhancerService:
             EnhancedPromptResponse with all enhancement data
         """
         
+        payload = await self.enhance_prompt_json(original_prompt, enhancement_type, target_audience)
+        return EnhancedPromptResponse.model_validate_json(payload)
+    
+    async def enhance_prompt_json(
+        self, 
+        original_prompt: str, 
+        enhancement_type: str = "general",
+        target_audience: str = "general"
+    ) -> bytes:
+        """
+        Enhance a prompt and return the serialized EnhancedPromptResponse
+        
+        Cached responses are returned as stored, without being rebuilt or
+        re-validated, so the API can send them to the client as-is.
+        """
+        
+        key = self._cache_key(original_prompt, enhancement_type, target_audience)
+        cached = self._cache.get(key)
+        if cached is not None:
+            return cached
+        
+        # Identical requests already in flight share one upstream call. The work
+        # runs in its own task so a disconnecting client can't cancel it for the rest
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(
+                self._enhance_and_cache(key, original_prompt, enhancement_type, target_audience)
+            )
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        
+        return await asyncio.shield(task)
+    
+    async def _enhance_and_cache(
+        self,
+        key: str,
+        original_prompt: str,
+        enhancement_type: str,
+        target_audience: str
+    ) -> bytes:
+        """Enhance a prompt, serialize the response and store it in the cache"""
+        response, from_model = await self._enhance_uncached(original_prompt, enhancement_type, target_audience)
+        payload = response.model_dump_json().encode()
+        # Fallbacks stand in for an upstream outage; caching them would keep
+        # serving the rule-based text long after the models recover
+        if from_model:
+            self._cache[key] = payload
+        return payload
+    
+    @staticmethod
+    def _cache_key(original_prompt: str, enhancement_type: str, target_audience: str) -> str:
+        """Build the cache key for a prompt and its enhancement options"""
+        return hashlib.blake2b(
+            f"{original_prompt}|{enhancement_type}|{target_audience}".encode(),
+            digest_size=16
+        ).hexdigest()
+    
+    async def _enhance_uncached(
+        self, 
+        original_prompt: str, 
+        enhancement_type: str,
+        target_audience: str
+    ) -> Tuple[EnhancedPromptResponse, bool]:
+        """
+        Run the full enhancement pipeline without consulting the cache
+        
+        Returns the response and whether a model answered, as opposed to the
+        rule-based fallback standing in for a failed upstream call.
+        """
+        
         try:
             # Create the enhancement prompt
             enhancement_prompt = self._create_enhancement_prompt(original_prompt, enhancement_type, target_audience)
             
-            # Call Hugging Face API
-            hf_response = await self._call_huggingface_api(enhancement_prompt)
+            # Call Hugging Face API (batched with concurrent requests when running),
+            # counting the original's words while the request is queued and in flight
+            hf_task = asyncio.create_task(self._batcher.submit(enhancement_prompt))
+            try:
+                await asyncio.sleep(0)
+                word_count_original = _word_count(original_prompt)
+                hf_response = await hf_task
+            finally:
+                hf_task.cancel()
+            
+            # No model answered: use the rule-based enhancement, which is not cached
+            from_model = hf_response is not None
+            if hf_response is None:
+                hf_response = self._create_fallback_enhancement(enhancement_prompt)
             
             # Parse response and create enhanced data
             enhanced_data = self._create_enhanced_response(original_prompt, hf_response, enhancement_type, target_audience)
             
             # Calculate metrics
-            word_count_original = len(original_prompt.split())
-            word_count_enhanced = len(enhanced_data["enhanced_prompt"].split())
+            word_count_enhanced = _word_count(enhanced_data["enhanced_prompt"])
             
-            # Create response object
+            # Create response object; the nested structure is built here from known-good
+            # values, so it skips validation and only the outer fields are checked
             response = EnhancedPromptResponse(
                 original_prompt=original_prompt,
                 enhanced_prompt=enhanced_data["enhanced_prompt"],
-                prompt_structure=PromptStructure(**enhanced_data["prompt_structure"]),
+                prompt_structure=PromptStructure.model_construct(**enhanced_data["prompt_structure"]),
                 improvement_summary=enhanced_data.get("improvement_summary", []),
                 estimated_improvement=enhanced_data.get("estimated_improvement", 75),
                 enhancement_type=enhancement_type,
@@ -94,166 +696,202 @@ class PromptEnhancerService:
                 usage_tips=enhanced_data.get("usage_tips", [])
             )
             
-            return response
+            return response, from_model
             
         except Exception as e:
-            logger.error(f"Error in enhance_prompt: {str(e)}")
+            logger.error("Error in enhance_prompt: %s", e)
             raise
     
     def _create_enhancement_prompt(self, original_prompt: str, enhancement_type: str, target_audience: str) -> str:
         """Create enhancement prompt for Hugging Face model"""
         
-        enhancement_instructions = {
-            "creative": "Focus on storytelling, creativity, and artistic elements.",
-            "technical": "Focus on technical precision, code requirements, and implementation details.", 
-            "business": "Focus on business objectives, ROI, and professional outcomes.",
-            "educational": "Focus on learning objectives and pedagogical clarity.",
-            "general": "Provide balanced enhancement suitable for any domain."
-        }
+        tail = _PROMPT_TAILS.get((enhancement_type, target_audience))
+        if tail is None:
+            tail = _build_prompt_tail(enhancement_type, target_audience)
+        
+        return _PROMPT_HEAD + original_prompt + tail
+
+    async def _query_models(
+        self,
+        inputs: Union[str, List[str]],
+        parse: Callable[[Any], Optional[Any]]
+    ) -> Optional[Any]:
+        """
+        POST inputs to all fallback models concurrently and return the first usable answer
         
-        audience_instructions = {
-            "beginner": "Use simple language and provide more context.",
-            "expert": "Use technical terminology and assume deep knowledge.",
-            "business": "Focus on business value and professional outcomes.",
-            "student": "Emphasize learning and educational value.",
-            "general": "Maintain accessibility for a general audience."
+        parse turns a decoded result into the value to return, or None when the
+        result carries nothing usable. Returns None when no model answered.
+        Raises HuggingFaceFatalError when every model rejected the request or
+        answered in an unusable form, so the caller can tell a bad request
+        shape from an upstream outage.
+        """
+        
+        # Only the inputs vary per request; the generation parameters are pre-serialized
+        body = b'{"inputs":' + orjson.dumps(inputs) + _BODY_SUFFIX
+        
+        # Ask every fallback model at once and take the first usable answer, so a
+        # loading or dead model no longer adds its full timeout to the request
+        tasks = {
+            asyncio.create_task(self._post_model_when_loaded(_MODEL_URL + model, body)): model
+            for model in _MODELS
         }
+        pending = set(tasks)
+        rejected = 0
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    try:
+                        result = task.result()
+                    except HuggingFaceFatalError as e:
+                        logger.warning("Model %s rejected the request: %s", tasks[task], e)
+                        rejected += 1
+                        continue
+                    except Exception as e:
+                        logger.warning("Model %s failed: %s", tasks[task], e)
+                        continue
+                    # None means the model was still loading after its retries
+                    if result is None:
+                        continue
+                    # A 200 without generated text doesn't win the race; keep
+                    # waiting on the models that are still working
+                    parsed = parse(result)
+                    if parsed is not None:
+                        return parsed
+                    logger.warning("Model %s returned no usable generation", tasks[task])
+                    rejected += 1
+            if rejected == len(tasks):
+                raise HuggingFaceFatalError("No Hugging Face model accepted the request")
+            return None
+        finally:
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+    
+    async def _post_model_when_loaded(self, url: str, body: bytes) -> Optional[Any]:
+        """POST to one model, backing off and retrying while it reports it is loading"""
         
-        return f"""Transform this basic prompt into a highly effective, detailed prompt:
-
-Original: "{original_prompt}"
-
-Enhancement type: {enhancement_instructions.get(enhancement_type, enhancement_instructions['general'])}
-Target audience: {audience_instructions.get(target_audience, audience_instructions['general'])}
-
-Enhanced prompt:"""
-
-    async def _call_huggingface_api(self, prompt: str) -> str:
-        """Make API call to Hugging Face"""
+        for attempt in range(_LOADING_ATTEMPTS):
+            result = await self._post_model(url, body)
+            if result is not None or attempt == _LOADING_ATTEMPTS - 1:
+                return result
+            # Non-blocking backoff so other requests keep running while the model warms up
+            await asyncio.sleep(min(2 ** attempt * 0.5, 4.0) + random.random() * 0.2)
+        return None
+    
+    # Only connect and pool timeouts are retried: they fail fast. Another 30 s
+    # read timeout would outlast the client's own request deadline
+    @retry(
+        retry=retry_if_exception_type((httpx.ConnectTimeout, httpx.PoolTimeout, HuggingFaceTransientError)),
+        wait=wait_exponential(multiplier=0.5, max=8) + wait_random(0, 1),
+        stop=stop_after_attempt(4),
+        reraise=True
+    )
+    async def _post_model(self, url: str, body: bytes) -> Optional[Any]:
+        """POST a generation request to one model; returns None while the model is loading"""
+        
+        async with self._limiter.slot() as started:
+            async with self._get_client().stream("POST", url, content=body) as response:
+                self._limiter.record(response.status_code, response.headers, started)
+                if response.status_code == 200:
+                    # Parse from the streamed chunks instead of buffering response.content,
+                    # giving up as soon as the body outgrows any plausible generation
+                    buffer = bytearray()
+                    async for chunk in response.aiter_bytes():
+                        buffer += chunk
+                        if len(buffer) > _MAX_RESPONSE_BYTES:
+                            raise HuggingFaceFatalError("Hugging Face response too large")
+                    return orjson.loads(buffer)
+                elif response.status_code == 503:
+                    return None
+                elif response.status_code == 429 or response.status_code >= 500:
+                    raise HuggingFaceTransientError(f"Hugging Face returned {response.status_code}")
+                raise HuggingFaceFatalError(f"Hugging Face returned {response.status_code}")
+    
+    async def _call_huggingface_api(self, prompt: str) -> Optional[str]:
+        """Make API call to Hugging Face; returns None when no model answered"""
         
         try:
-            headers = {"Content-Type": "application/json"}
-            if self.api_key:
-                headers["Authorization"] = f"Bearer {self.api_key}"
-            
-            # Try multiple models if one fails
-            models = [
-                "microsoft/DialoGPT-medium",
-                "facebook/blenderbot-400M-distill",
-                "google/flan-t5-base"
-            ]
+            text = await self._query_models(prompt, _extract_text)
+            if text is not None:
+                return text
             
-            for model in models:
-                try:
-                    url = f"https://api-inference.huggingface.co/models/{model}"
-                    async with httpx.AsyncClient(timeout=30.0) as client:
-                        response = await client.post(
-                            url,
-                            headers=headers,
-                            json={
-                                "inputs": prompt,
-                                "parameters": {
-                                    "max_new_tokens": 500,
-                                    "temperature": 0.7,
-                                    "do_sample": True
-                                }
-                            }
-                        )
-                        
-                        if response.status_code == 200:
-                            result = response.json()
-                            if isinstance(result, list) and len(result) > 0:
-                                return result[0].get("generated_text", prompt)
-                            return str(result)
-                        elif response.status_code == 503:
-                            # Model is loading, wait and try next
-                            continue
-                            
-                except Exception as e:
-                    logger.warning(f"Model {model} failed: {str(e)}")
-                    continue
-            
-            # If all models fail, create a fallback response
+            # If all models fail, the caller falls back to the rule-based enhancement
             logger.warning("All Hugging Face models failed, using fallback enhancement")
-            return self._create_fallback_enhancement(prompt)
+            return None
                 
         except Exception as e:
-            logger.error(f"Hugging Face API call failed: {str(e)}")
-            return self._create_fallback_enhancement(prompt)
+            logger.error("Hugging Face API call failed: %s", e)
+            return None
+    
+    async def _call_huggingface_api_batch(self, prompts: List[str]) -> List[Optional[str]]:
+        """Make a single API call to Hugging Face for several prompts"""
+        
+        if len(prompts) == 1:
+            return [await self._call_huggingface_api(prompts[0])]
+        
+        try:
+            texts = await self._query_models(prompts, lambda result: _extract_texts(result, len(prompts)))
+        except HuggingFaceFatalError as e:
+            # The models turned down the batched form (or answered it in a shape
+            # we can't use); single prompts may still work
+            logger.warning("Batched Hugging Face call rejected (%s), retrying prompts individually", e)
+            return list(await asyncio.gather(*(self._call_huggingface_api(p) for p in prompts)))
+        except Exception as e:
+            logger.error("Hugging Face batch call failed: %s", e)
+            texts = None
+        
+        # Every model already failed after its retries; asking again per prompt
+        # would only multiply the load on an upstream that is down
+        if texts is None:
+            logger.warning("All Hugging Face models failed, using fallback enhancement")
+            return [None] * len(prompts)
+        
+        return texts
     
     def _create_fallback_enhancement(self, original_prompt: str) -> str:
         """Create a rule-based enhancement when AI models fail"""
-        
-        # Extract key components and enhance them
-        enhanced = f"""**Context**: You are working on a task that requires clear, structured communication.
-
-**Objective**: {original_prompt}
-
-**Requirements**:
-- Provide detailed, specific output
-- Use clear, professional language  
-- Include relevant examples where helpful
-- Structure your response logically
-
-**Output Format**: Please provide a comprehensive response that addresses all aspects of the request.
-
-**Additional Instructions**: Take your time to think through the request and provide the most helpful response possible."""
-
-        return enhanced
+        return _FALLBACK_TEMPLATE % original_prompt
     
     def _create_enhanced_response(self, original_prompt: str, ai_response: str, enhancement_type: str, target_audience: str) -> Dict[str, Any]:
         """Create structured response from AI output"""
         
-        # Clean up the AI response
-        enhanced_prompt = ai_response.replace(original_prompt, "").strip()
+        # Clean up the AI response; an echoed prompt is usually a prefix, which
+        # avoids scanning the whole response for it
+        stripped = ai_response.lstrip()
+        if stripped.startswith(original_prompt):
+            enhanced_prompt = stripped[len(original_prompt):].strip()
+        else:
+            enhanced_prompt = ai_response.replace(original_prompt, "").strip()
         if not enhanced_prompt or len(enhanced_prompt) < len(original_prompt):
             enhanced_prompt = self._create_fallback_enhancement(original_prompt)
         
         # Create structured breakdown
+        context = _CONTEXTS.get((enhancement_type, target_audience))
+        if context is None:
+            context = f"Enhanced prompt for {enhancement_type} use case targeting {target_audience} audience"
+        
         prompt_structure = {
-            "context": f"Enhanced prompt for {enhancement_type} use case targeting {target_audience} audience",
+            "context": context,
             "objective": f"Transform the user's request: '{original_prompt}' into actionable instructions",
-            "requirements": [
-                "Provide clear, specific guidance",
-                "Use appropriate language for target audience", 
-                "Include structured format",
-                "Maintain original intent while adding clarity"
-            ],
+            "requirements": list(_STATIC_REQUIREMENTS),
             "target_audience": target_audience,
             "output_format": "Detailed response following the enhanced prompt structure",
             "tone_and_style": self._get_tone_for_type(enhancement_type),
             "examples": [],
-            "constraints": [
-                "Stay true to original request",
-                "Avoid unnecessary complexity",
-                "Ensure actionable output"
-            ]
+            "constraints": list(_STATIC_CONSTRAINTS)
         }
         
         return {
             "enhanced_prompt": enhanced_prompt,
             "prompt_structure": prompt_structure,
-            "improvement_summary": [
-                "Added clear structure and context",
-                "Specified requirements and format",
-                "Tailored language for target audience",
-                "Enhanced clarity and specificity"
-            ],
+            "improvement_summary": _IMPROVEMENT_SUMMARY,
             "estimated_improvement": 70,
-            "usage_tips": [
-                "Use this enhanced prompt as-is for better AI responses",
-                "Adjust requirements based on your specific needs",
-                "Consider the target audience when using the output"
-            ]
+            "usage_tips": _USAGE_TIPS
         }
     
     def _get_tone_for_type(self, enhancement_type: str) -> str:
         """Get appropriate tone for enhancement type"""
-        tones = {
-            "creative": "Inspiring, imaginative, and engaging",
-            "technical": "Precise, professional, and detailed", 
-            "business": "Professional, results-oriented, and strategic",
-            "educational": "Clear, supportive, and informative",
-            "general": "Balanced, professional, and accessible"
-        }
-        return tones.get(enhancement_type, tones["general"])
\ No newline at end of file
+        return _TONES.get(enhancement_type, _TONES["general"])
+